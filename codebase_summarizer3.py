@@ -13,11 +13,29 @@ import argparse
 import fnmatch
 import mimetypes
 import logging
+import re
 import json
+import asyncio
+import functools
+import subprocess
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 from datetime import datetime, timezone, timedelta
 import time
 import openai
 
+try:
+    import orjson  # Optional: much faster JSON encoding/decoding for large outputs
+except ImportError:
+    orjson = None
+
+try:
+    from pathspec import GitIgnoreSpec  # Optional (pathspec 0.10+): precompiled matcher following Git's ignore rules
+except ImportError:
+    GitIgnoreSpec = None
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,30 +44,201 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Timezone used for all timestamps (UTC-5), built once
+_EST = timezone(timedelta(hours=-5))
+
 # Default values
 DEFAULT_MODEL = "gpt-4.1-nano-2025-04-14"
-DEFAULT_OUTPUT_FILE = f"processed-codebase_{datetime.now(timezone(timedelta(hours=-5))).strftime('%Y%m%d_%H%M%S')}.json"
-DEFAULT_TEXT_EXTENSIONS = [
+DEFAULT_OUTPUT_FILE = f"processed-codebase_{datetime.now(_EST).strftime('%Y%m%d_%H%M%S')}.json"
+DEFAULT_TEXT_EXTENSIONS = frozenset({
     ".py", ".js", ".ts", ".html", ".css", ".json", ".md", ".txt", 
     ".jsx", ".tsx", ".vue", ".yml", ".yaml", ".toml", ".ini", ".cfg",
     ".sh", ".bash", ".c", ".cpp", ".h", ".hpp", ".java", ".go", ".rb",
     ".php", ".swift", ".rs", ".scala", ".sql", ".xml",
-]
+})
+# Extensions that are always binary, rejected without opening the file
+BINARY_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".pdf",
+    ".zip", ".gz", ".xz", ".tar", ".7z", ".pyc", ".pyo", ".so", ".dll",
+    ".exe", ".o", ".a", ".class", ".woff", ".woff2", ".ttf", ".otf",
+    ".mp3", ".mp4", ".mov", ".avi",
+})
+# Directories that are never worth walking, even without a .gitignore
+DEFAULT_IGNORED_DIRS = frozenset({
+    ".git", "node_modules", "__pycache__", ".venv", "dist", "build",
+})
 
 # Batch processing settings
-DEFAULT_BATCH_SIZE = 5
+MEGA_BATCH_SIZE = 20  # Files packed into one request so the fixed instructions are amortized
+DEFAULT_BATCH_SIZE = MEGA_BATCH_SIZE
 TRUNCATION_LIMIT = 35000  # Character limit for file content before truncation
 DEFAULT_MAX_TOKEN_LIMIT = 50000  # Maximum token budget for entire JSON output
 DEFAULT_PAUSE_SECONDS = 0  # Default pause between batches
+DEFAULT_CONTEXT_WINDOW = 1047576  # Context window (prompt + completion) of the default model, in tokens
+DEFAULT_MAX_COMPLETION_TOKENS = 32768  # Maximum completion tokens of the default model
+INITIAL_TOKENS_PER_BYTE = 0.25  # Starting estimate of completion tokens needed per byte of source
+TOKENS_PER_BYTE_SMOOTHING = 0.3  # Weight of the latest batch in the tokens-per-byte moving average
+TOKEN_LIMIT_SAFETY_FACTOR = 1.5  # Headroom over the estimated completion tokens for a batch
+MIN_TOKENS_PER_FILE = 500  # Smallest completion budget per file in a batch that still fits a useful analysis
+
+# Concurrency and rate limiting settings
+DEFAULT_MAX_CONCURRENCY = 8  # Maximum number of batches in flight at once
+DEFAULT_REQUESTS_PER_MINUTE = 500  # Initial RPM budget, refined from response headers
+DEFAULT_TOKENS_PER_MINUTE = 200000  # Initial TPM budget, refined from response headers
+CHARS_PER_TOKEN = 4  # Rough characters-per-token ratio used to estimate prompt size
+DEFAULT_READ_WORKERS = 16  # Threads used to read the files of a batch in parallel
+PREFETCH_BATCHES = 2  # Batches whose contents are read ahead of the API calls
+
+# Shared by all batch reads so the reader threads are started once, not per batch
+IO_POOL = ThreadPoolExecutor(max_workers=DEFAULT_READ_WORKERS, thread_name_prefix="file-reader")
 
 # Verbosity levels
 VERBOSITY_QUIET = 0    # Only errors and critical information
 VERBOSITY_NORMAL = 1   # Default logging (INFO level)
 VERBOSITY_VERBOSE = 2  # Detailed logging
 
+# Instructions shared by every analysis request. They are sent as a stable system message so the
+# per-batch user message only carries the file contents, and the prefix can be cached server-side.
+_ANALYSIS_SYSTEM_PROMPT = """\
+You are an expert code analyzer that always returns pure JSON with no markdown formatting or explanations. You strictly adhere to token limits and JSON syntax rules.
+
+You will receive batches of source code files and must provide a detailed analysis of each batch in JSON format. Every request starts with a TOKEN_LIMIT=<n> line followed by the FILES to analyze. Your ENTIRE response MUST stay UNDER TOKEN_LIMIT tokens - this is a HARD REQUIREMENT.
+
+FOLLOW THIS EXACT RESPONSE STRUCTURE - DO NOT DEVIATE:
+{
+  "files": {
+    "file_path_1": {
+      "file_type": "...",
+      "file_purpose": "...",
+      "dependencies": ["dep1", "dep2"],
+      "classes": [
+        {
+          "name": "ClassName",
+          "purpose": "Brief description",
+          "methods": ["method1", "method2"]
+        }
+      ],
+      "functions": [
+        {
+          "name": "funcName",
+          "purpose": "Brief description"
+        }
+      ],
+      "api_endpoints": [
+        {
+          "path": "/path",
+          "method": "GET/POST/etc"
+        }
+      ],
+      "design_patterns": ["Pattern description"],
+      "integration_points": ["Integration description"],
+      "relationships": ["Relationship description"]
+    },
+    "file_path_2": {
+      ...similar structure...
+    }
+  }
+}
+
+STRICT TOKEN LIMIT ENFORCEMENT:
+- Your ENTIRE response MUST be under the TOKEN_LIMIT stated in the request
+- If you cannot fit complete analysis for all files within token limits:
+  1. Reduce detail while maintaining coverage of all files
+  2. Prioritize the most important information for each file
+  3. Use concise descriptions instead of full explanations
+  4. Omit less critical information when necessary
+- Token limits take precedence over completeness of analysis
+- Prioritize breadth (covering all files) over depth
+
+CRITICAL JSON RULES:
+1. Use DOUBLE QUOTES for all keys and string values
+2. NO SEMICOLONS in JSON - ever!
+3. NO TRAILING COMMAS after the last item in objects or arrays
+4. Every opening { or [ must have a matching closing } or ]
+5. Every property name must be quoted: "name": value
+6. Arrays use square brackets with comma-separated values
+7. DO NOT include any field with empty values - omit them entirely
+8. Commas separate items in arrays and objects, but NOT after the last item
+9. NEVER use "files" as an array - it must be an object with file paths as keys
+
+For each file, extract the following information (prioritizing the most important aspects):
+
+* **File Type:** Categorize the file (e.g., "model", "service", "api_endpoint", "utility", etc.)
+* **File Purpose:** A brief description of the file's main purpose and functionality
+* **Dependencies:** List key imports and dependencies used by this file
+* **Classes:** List any classes defined in the file, with details for each:
+  * **Name:** Class name
+  * **Purpose:** A brief description of the class
+  * **Methods:** Key methods with their purpose
+  * **Inheritance:** Parent classes or interfaces (if significant)
+* **Functions:** List top-level functions with:
+  * **Name:** Function name
+  * **Purpose:** A short description of what the function does
+* **API Endpoints:** If the file defines API endpoints:
+  * **Path:** The route path 
+  * **Method:** HTTP method (GET, POST, etc.)
+* **Design Patterns:** Identify any notable design patterns used
+* **Integration Points:** Note where this file interfaces with other components
+* **Relationships:** How this file relates to other parts of the system
+
+CONSISTENCY GUIDELINES:
+1. Use similar detail levels across similar file types
+2. Include the same property types for files of similar purposes
+3. Apply consistent naming conventions in your descriptions
+4. Use consistent terminology throughout the analysis
+
+ANALYSIS PRIORITIES (focus on these when token limits are tight):
+1. File purpose and type
+2. Key dependencies 
+3. Important classes and methods
+4. Key functions
+5. Integration points and relationships
+
+FINAL VALIDATION STEPS (perform these before submitting):
+1. Check all brackets and braces are properly matched
+2. Verify no trailing commas exist in your JSON
+3. Confirm all property names and string values use double quotes
+4. Ensure the response is nested exactly as shown in the template
+5. Verify "files" is an object, not an array
+6. Confirm your response is under the token limit by removing unnecessary detail if needed
+
+Remember: Return ONLY valid JSON - no explanation text, no markdown formatting, no code blocks.
+"""
+
+# Instructions for the optimization pass; the user message is only the JSON to optimize
+_OPTIMIZATION_SYSTEM_PROMPT = """\
+You are an expert at optimizing and compressing JSON data while preserving essential information and structure. Your output must be valid JSON with no syntax errors.
+
+You will receive a JSON document to optimize and compress without losing any essential information.
+You must keep the exact same structure with "metadata", "file_tree", and "file_analyses" keys.
+
+OPTIMIZATION GUIDELINES:
+1. Preserve the exact same structure with "metadata", "file_tree", and "file_analyses" keys
+2. Remove any redundant or duplicated information
+3. Shorten descriptions while preserving key insights
+4. Make the descriptions more concise but maintain the same meaning
+5. Do not remove any file paths or entries from "file_analyses"
+6. Keep all metadata intact
+
+CRITICAL JSON RULES:
+1. Use DOUBLE QUOTES for all keys and string values (never single quotes)
+2. NO trailing commas after the last item in objects or arrays
+3. Every property name must be quoted: "name": value
+4. DO NOT remove any of the top-level keys (metadata, file_tree, file_analyses)
+5. The result MUST have the same structure as the input
+6. Carefully check for balanced brackets and braces
+7. Ensure there are no syntax errors in the resulting JSON
+
+Return ONLY the optimized JSON with no additional text or explanation. Ensure it's valid JSON that will parse correctly.
+"""
+
 def clean_empty_values(data):
     """
-    Recursively remove empty lists, dictionaries, None values and empty strings from a dictionary.
+    Remove empty lists, dictionaries, None values and empty strings from a dictionary, at any depth.
+    
+    The structure is walked iteratively with an explicit stack instead of one recursive
+    call per nested value. Each container is cleaned before it is added to its parent,
+    so containers that end up empty are dropped too.
     
     Args:
         data: Dictionary to clean
@@ -58,85 +247,273 @@ def clean_empty_values(data):
         Cleaned dictionary with empty values removed
     """
     if isinstance(data, dict):
-        # Process dictionary
-        return {
-            k: v for k, v in 
-            ((k, clean_empty_values(v)) for k, v in data.items())
-            if v and v != {} and v != [] and v != ""
-        }
+        root = {}
+        stack = [(root, iter(data.items()), None)]
     elif isinstance(data, list):
-        # Process list
-        return [v for v in (clean_empty_values(v) for v in data) if v and v != {} and v != [] and v != ""]
+        root = []
+        stack = [(root, iter(data), None)]
     else:
         # Return scalar value
         return data
+    
+    # Each frame holds the cleaned container, the iterator over the original and its key in the parent
+    while stack:
+        cleaned, items, key_in_parent = stack[-1]
+        is_dict = isinstance(cleaned, dict)
+        for item in items:
+            if is_dict:
+                key, value = item
+            else:
+                key, value = None, item
+            
+            # Descend into nested containers; this frame resumes once the child is done
+            if isinstance(value, dict):
+                stack.append(({}, iter(value.items()), key))
+                break
+            if isinstance(value, list):
+                stack.append(([], iter(value), key))
+                break
+            
+            # Truthiness alone drops None, "", [] and {} (and 0/False, which the analysis schema never uses)
+            if value:
+                if is_dict:
+                    cleaned[key] = value
+                else:
+                    cleaned.append(value)
+        else:
+            # All items are processed; hand the container to its parent unless it ended up empty
+            stack.pop()
+            if stack and cleaned:
+                parent = stack[-1][0]
+                if isinstance(parent, dict):
+                    parent[key_in_parent] = cleaned
+                else:
+                    parent.append(cleaned)
+    
+    return root
+
+def build_size_index(files: list, file_entries: Optional[dict] = None) -> dict:
+    """
+    Look up the size of every file with one os.scandir pass per parent directory.
+    
+    DirEntry.stat() replaces the separate exists + getsize pair with a single stat
+    per file. It is served from the directory read itself only on Windows; on other
+    platforms it is still one stat syscall per file. The index is then reused for
+    every batch instead of re-stating the same files. Files that already have a
+    DirEntry from file discovery take their size from it without listing their
+    directory again.
+    
+    Args:
+        files: List of file paths
+        file_entries: Optional dictionary mapping file paths to their DirEntry
+        
+    Returns:
+        Dictionary mapping each file path to its size in bytes
+    """
+    file_entries = file_entries or {}
+    size_index = {}
+    
+    # Group the wanted file names by their parent directory
+    files_by_dir = {}
+    for file_path in files:
+        entry = file_entries.get(file_path)
+        if entry is not None:
+            try:
+                size_index[file_path] = entry.stat().st_size
+                continue
+            except OSError:
+                pass  # Retry below with a fresh directory listing
+        parent, name = os.path.split(file_path)
+        files_by_dir.setdefault(parent, {})[name] = file_path
+    
+    for parent, wanted in files_by_dir.items():
+        try:
+            with os.scandir(parent or os.curdir) as entries:
+                for entry in entries:
+                    file_path = wanted.get(entry.name)
+                    if file_path is None:
+                        continue
+                    try:
+                        size_index[file_path] = entry.stat().st_size
+                    except OSError as e:
+                        logger.warning(f"Could not get size of {file_path}: {str(e)}")
+        except OSError as e:
+            logger.warning(f"Could not list directory {parent}: {str(e)}")
+    return size_index
+
+def _json_bytes(data, pretty: bool = False) -> bytes:
+    """
+    Serialize data to UTF-8 JSON bytes, using orjson when it is installed.
+    
+    Args:
+        data: Data to serialize
+        pretty: Pretty-print with two-space indentation instead of compact output
+        
+    Returns:
+        JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def json_dumps(data, pretty: bool = False) -> str:
+    """Serialize data to a JSON string; see _json_bytes."""
+    return _json_bytes(data, pretty).decode('utf-8')
+
+def json_loads(json_str):
+    """Parse a JSON string, using orjson when it is installed (its errors subclass json.JSONDecodeError)."""
+    if orjson is not None:
+        return orjson.loads(json_str)
+    return json.loads(json_str)
+
+def write_json_file(file_path: str, data) -> None:
+    """
+    Write data as indented JSON in a single write, using orjson when it is installed.
+    
+    The JSON goes to a temporary file next to the target, which is then renamed over it,
+    so an interrupted write never leaves a half-written file behind.
+    """
+    json_bytes = _json_bytes(data, pretty=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'wb') as out_f:
+        out_f.write(json_bytes)
+    os.replace(tmp_path, file_path)
 
-def calculate_batch_size_bytes(batch_files: list) -> int:
+def calculate_batch_size_bytes(batch_files: list, size_index: dict) -> int:
     """
-    Calculate the total size in bytes of a batch of files, safely handling any errors.
+    Calculate the total size in bytes of a batch of files from the size index.
     
     Args:
         batch_files: List of file paths
+        size_index: Dictionary mapping file paths to sizes, from build_size_index
         
     Returns:
         Total size in bytes
     """
-    total_size = 0
-    for file_path in batch_files:
-        try:
-            # Normalize path separators for Windows
-            normalized_path = os.path.normpath(file_path)
-            if os.path.exists(normalized_path):
-                total_size += os.path.getsize(normalized_path)
-        except (OSError, IOError) as e:
-            logger.warning(f"Could not get size of {file_path}: {str(e)}")
-    return total_size
-
-def calculate_total_codebase_size(files: list) -> int:
+    return sum(size_index.get(file_path, 0) for file_path in batch_files)
+
+def calculate_total_codebase_size(files: list, size_index: dict) -> int:
     """
     Calculate the total size of the codebase based on the list of files.
     
     Args:
         files: List of file paths
+        size_index: Dictionary mapping file paths to sizes, from build_size_index
         
     Returns:
         Total size in bytes
     """
-    total_size = 0
-    for file_path in files:
-        try:
-            # Normalize path separators for Windows
-            normalized_path = os.path.normpath(file_path)
-            if os.path.exists(normalized_path):
-                total_size += os.path.getsize(normalized_path)
-        except (OSError, IOError) as e:
-            logger.warning(f"Could not get size of {file_path}: {str(e)}")
-    return total_size
-
-def calculate_batch_token_limit(batch_size_bytes: int, total_codebase_size: int, max_token_limit: int) -> int:
+    return sum(size_index.get(file_path, 0) for file_path in files)
+
+def calculate_batch_token_limit(batch_size_bytes: int, total_codebase_size: int, max_token_limit: int,
+                                tokens_per_byte: float = INITIAL_TOKENS_PER_BYTE, file_count: int = 1) -> int:
     """
-    Calculate token limit for a batch based on its proportion of the total codebase size.
+    Calculate token limit for a batch from the completion tokens per byte observed so far,
+    never exceeding the batch's proportion of the total token budget, but never going
+    below MIN_TOKENS_PER_FILE for each file in the batch.
     
     Args:
         batch_size_bytes: Size of the current batch in bytes
         total_codebase_size: Total size of the codebase in bytes
         max_token_limit: Maximum token limit for the entire output
+        tokens_per_byte: Running estimate of completion tokens needed per byte of source
+        file_count: Number of files in the batch
         
     Returns:
         Token limit for this batch
     """
+    # The limit is enforced server-side, so every file needs room for its analysis
+    minimum_limit = MIN_TOKENS_PER_FILE * max(file_count, 1)
+    
     # Ensure we don't divide by zero
     if total_codebase_size <= 0:
-        return max_token_limit // 10  # Default to 10% if total size unknown
+        return max(max_token_limit // 10, minimum_limit)  # Default to 10% if total size unknown
     
-    # Calculate proportion and corresponding token limit
+    # Calculate proportion and corresponding share of the overall budget
     proportion = batch_size_bytes / total_codebase_size
-    token_limit = int(proportion * max_token_limit)
+    proportional_limit = int(proportion * max_token_limit)
+    
+    # Only ask for what batches like this one have actually needed, plus headroom
+    adaptive_limit = int(batch_size_bytes * tokens_per_byte * TOKEN_LIMIT_SAFETY_FACTOR)
+    token_limit = min(proportional_limit, adaptive_limit)
     
-    # Ensure a minimum sensible limit (at least 500 tokens)
-    minimum_limit = 500
     return max(token_limit, minimum_limit)
 
+def update_tokens_per_byte(tokens_per_byte: float, completion_tokens: int, batch_size_bytes: int) -> float:
+    """
+    Fold the completion tokens used by a finished batch into the running tokens-per-byte estimate.
+    
+    Args:
+        tokens_per_byte: Current exponential moving average of completion tokens per byte
+        completion_tokens: Completion tokens reported in the response usage
+        batch_size_bytes: Size of the batch in bytes
+        
+    Returns:
+        Updated tokens-per-byte estimate
+    """
+    if not completion_tokens or batch_size_bytes <= 0:
+        return tokens_per_byte
+    
+    observed = completion_tokens / batch_size_bytes
+    return TOKENS_PER_BYTE_SMOOTHING * observed + (1 - TOKENS_PER_BYTE_SMOOTHING) * tokens_per_byte
+
+def estimate_batch_prompt_tokens(batch_files: list, size_index: dict) -> int:
+    """
+    Estimate the prompt tokens a batch will use, based on file sizes capped at the truncation limit.
+    
+    Args:
+        batch_files: List of file paths
+        size_index: Dictionary mapping file paths to sizes, from build_size_index
+        
+    Returns:
+        Estimated number of prompt tokens, including the system instructions
+    """
+    prompt_chars = len(_ANALYSIS_SYSTEM_PROMPT)
+    for file_path in batch_files:
+        # Each file is sent with a "--- FILE i: path ---" header and is truncated past the limit
+        prompt_chars += min(size_index.get(file_path, 0), TRUNCATION_LIMIT) + len(file_path) + 32
+    return prompt_chars // CHARS_PER_TOKEN
+
+def pack_batches(files: list, batch_size: int, size_index: dict, total_codebase_size: int, max_token_limit: int,
+                 context_window: int, max_completion_tokens: int) -> list:
+    """
+    Pack files into batches of up to batch_size files, re-splitting only the batches whose
+    prompt plus completion budget would not fit the model's context window.
+    
+    Args:
+        files: List of file paths
+        batch_size: Maximum number of files per batch
+        size_index: Dictionary mapping file paths to sizes, from build_size_index
+        total_codebase_size: Total size of the codebase in bytes
+        max_token_limit: Maximum token limit for the entire output
+        context_window: Model context window (prompt + completion) in tokens
+        max_completion_tokens: Maximum completion tokens the model can return
+        
+    Returns:
+        List of batches, each a list of file paths
+    """
+    batches = []
+    pending = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    
+    while pending:
+        batch = pending.pop(0)
+        completion_tokens = min(
+            calculate_batch_token_limit(calculate_batch_size_bytes(batch, size_index), total_codebase_size, max_token_limit,
+                                        file_count=len(batch)),
+            max_completion_tokens
+        )
+        
+        if estimate_batch_prompt_tokens(batch, size_index) + completion_tokens <= context_window or len(batch) == 1:
+            batches.append(batch)
+        else:
+            # Split in half and re-check both parts, keeping the original file order
+            middle = len(batch) // 2
+            pending[:0] = [batch[:middle], batch[middle:]]
+    
+    return batches
+
 def set_verbosity(verbosity_level: int) -> None:
     """Set logging level based on verbosity."""
     if verbosity_level == VERBOSITY_QUIET:
@@ -148,18 +525,47 @@ def set_verbosity(verbosity_level: int) -> None:
     
     logger.debug(f"Verbosity level set to {verbosity_level}")
 
-def is_text_file(file_path: str) -> bool:
-    """Determine if a file is text-based using extension and MIME type."""
+def file_extension(file_path: str) -> str:
+    """
+    Return the lowercased extension of a path, including the leading dot.
+    
+    Cheaper than os.path.splitext for the hot text-file check: only the final
+    path component is split, and dotfiles such as .bashrc have no extension.
+    """
+    name = file_path.rpartition(os.sep)[2]
+    if os.altsep:
+        name = name.rpartition(os.altsep)[2]
+    stem, dot, ext = name.rpartition('.')
+    if not dot or not stem.strip('.'):
+        return ''
+    return '.' + ext.lower()
+
+def is_text_file(file_path: str, entry: Optional[os.DirEntry] = None) -> bool:
+    """
+    Determine if a file is text-based using extension and MIME type.
+    
+    Args:
+        file_path: Path of the file to check
+        entry: DirEntry for the file from a directory scan, if available; it
+            proves the file exists without another stat call
+    
+    Returns:
+        True if the file looks like text, False otherwise
+    """
     # Normalize path for Windows
     normalized_path = os.path.normpath(file_path)
     
-    # Check if file exists
-    if not os.path.exists(normalized_path):
+    # Known binary extensions need neither a stat nor a sniff
+    ext = file_extension(normalized_path)
+    if ext in BINARY_EXTENSIONS:
+        return False
+    
+    # Check if file exists, unless the directory scan already found it
+    if entry is None and not os.path.exists(normalized_path):
         logger.warning(f"File not found when checking if text file: {file_path}")
         return False
     
     # Check by extension first (faster)
-    ext = os.path.splitext(normalized_path)[1].lower()
     if ext in DEFAULT_TEXT_EXTENSIONS:
         return True
     
@@ -168,66 +574,144 @@ def is_text_file(file_path: str) -> bool:
     if mime_type and mime_type.startswith('text/'):
         return True
     
-    # Last resort: try to read as text
+    # Last resort: sniff a raw sample for NUL bytes, as git and file(1) do
     try:
-        with open(normalized_path, 'r', encoding='utf-8') as f:
-            f.read(1024)  # Try to read a sample
-        return True
-    except UnicodeDecodeError:
-        return False
+        with open(normalized_path, 'rb') as f:
+            sample = f.read(512)
+        # Empty files have nothing worth analyzing
+        return b'\x00' not in sample and sample.decode('utf-8', errors='ignore') != ''
     except Exception as e:
         logger.warning(f"Error checking if {file_path} is text: {str(e)}")
         return False
 
+# Non-empty, non-comment lines of a .gitignore, with surrounding whitespace
+# stripped, extracted in a single scan
+_GITIGNORE_LINE_RE = re.compile(r'^[^\S\r\n]*([^\s#][^\r\n]*?)\s*$', re.MULTILINE)
+
+@functools.lru_cache(maxsize=None)
+def _read_gitignore_patterns(gitignore_path: str, mtime_ns: int) -> tuple:
+    """Read the patterns of a .gitignore; cached until the file is modified."""
+    with open(gitignore_path, 'r', encoding='utf-8') as f:
+        return tuple(_GITIGNORE_LINE_RE.findall(f.read()))
+
 def parse_gitignore(gitignore_path: str, verbosity: int) -> list:
     """Parse a .gitignore file and return patterns."""
-    patterns = []
-    if not os.path.exists(gitignore_path):
+    try:
+        mtime_ns = os.stat(gitignore_path).st_mtime_ns
+    except OSError:
         if verbosity >= VERBOSITY_NORMAL:
             logger.info(f"No .gitignore found at {gitignore_path}")
-        return patterns
-    
-    with open(gitignore_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            # Skip empty lines and comments
-            if not line or line.startswith('#'):
-                continue
-            # Add the pattern
-            patterns.append(line)
+        return []
     
-    return patterns
+    return list(_read_gitignore_patterns(gitignore_path, mtime_ns))
 
-def is_ignored(file_path: str, root_path: str, ignore_patterns: list) -> bool:
-    """Check if a file should be ignored based on gitignore patterns."""
-    if not ignore_patterns:
-        return False
+def compile_ignore_matcher(ignore_patterns: list) -> Optional[Callable[[str], bool]]:
+    """
+    Compile gitignore patterns into a single matcher.
     
-    # Convert to relative path from the root
-    rel_path = os.path.relpath(file_path, root_path)
-    # Replace backslashes with forward slashes for consistent pattern matching
-    rel_path = rel_path.replace('\\', '/')
+    When pathspec is installed its precompiled GitIgnoreSpec is used, which follows
+    Git's .gitignore rules, including last-match-wins negation. Otherwise all
+    positive patterns are translated with fnmatch and joined into one regex, and
+    negated patterns are folded in as a leading negative lookahead, so each path is
+    checked with one regex match instead of two fnmatch calls per pattern.
+    
+    Args:
+        ignore_patterns: Patterns returned by parse_gitignore
+        
+    Returns:
+        Function taking a relative path (with forward slashes) and returning True if it
+        is ignored, or None if there are no patterns that could ignore anything
+    """
+    if GitIgnoreSpec is not None:
+        spec = GitIgnoreSpec.from_lines(ignore_patterns)
+        return spec.match_file if spec.patterns else None
+    
+    positive = []
+    negative = []
     
-    # Check each pattern
     for pattern in ignore_patterns:
         # Skip empty patterns
         if not pattern:
             continue
-            
+        
         # Handle negation (patterns that start with !)
-        negated = pattern.startswith('!')
-        if negated:
+        target = positive
+        if pattern.startswith('!'):
+            target = negative
             pattern = pattern[1:]
         
-        # Simple pattern matching using fnmatch
-        match = fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(rel_path, f"*/{pattern}")
-        
-        if match:
-            return not negated
+        # Match the whole relative path or any trailing part of it. Paths arrive
+        # in '/' form from is_ignored, so no normcase: it would turn them into '\'
+        target.append(fnmatch.translate(pattern))
+        target.append(fnmatch.translate(f"*/{pattern}"))
+    
+    if not positive:
+        return None
+    
+    combined = "|".join(positive)
+    if negative:
+        combined = f"(?!(?:{'|'.join(negative)}))(?:{combined})"
+    ignore_regex = re.compile(combined)
+    
+    return lambda rel_path: ignore_regex.match(rel_path) is not None
+
+def is_ignored(file_path: str, root_path: str, ignore_matcher: Optional[Callable[[str], bool]],
+               is_dir: bool = False) -> bool:
+    """
+    Check if a path should be ignored using a matcher from compile_ignore_matcher.
+    
+    Directories are also tried with a trailing slash, so directory-only patterns
+    such as "build/" match them.
+    """
+    if ignore_matcher is None:
+        return False
+    
+    # Convert to relative path from the root
+    rel_path = os.path.relpath(file_path, root_path)
+    # Replace backslashes with forward slashes for consistent pattern matching
+    rel_path = rel_path.replace('\\', '/')
     
-    return False
+    if is_dir:
+        return ignore_matcher(rel_path) or ignore_matcher(rel_path + '/')
+    return ignore_matcher(rel_path)
 
-def get_file_tree(directory: str, ignore_patterns: list, verbosity: int) -> str:
+def _scandir_files(root: str, root_dir: str, ignore_matcher: Optional[Callable[[str], bool]],
+                   ignored: list):
+    """
+    Recursively yield a DirEntry for every file below root that is not ignored.
+    
+    DirEntry objects carry the file type from the directory read, so no extra
+    stat call is needed per file. Ignored directories are pruned before they are
+    read, so nothing below them is ever visited. Like os.walk, symlinked
+    directories are not followed.
+    
+    Args:
+        root: Directory to scan
+        root_dir: Directory the ignore patterns are relative to
+        ignore_matcher: Matcher from compile_ignore_matcher, or None
+        ignored: List that collects the paths of ignored files and directories
+    """
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        # Skip unreadable or vanished directories, as os.walk does
+        logger.warning(f"Could not list directory {root}: {str(e)}")
+        return
+    
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in DEFAULT_IGNORED_DIRS or is_ignored(entry.path, root_dir, ignore_matcher, is_dir=True):
+                    ignored.append(entry.path)
+                    continue
+                yield from _scandir_files(entry.path, root_dir, ignore_matcher, ignored)
+            elif entry.is_file():
+                if is_ignored(entry.path, root_dir, ignore_matcher):
+                    ignored.append(entry.path)
+                    continue
+                yield entry
+
+def get_file_tree(directory: str, ignore_matcher: Optional[Callable[[str], bool]], verbosity: int) -> str:
     """Generate a tree-style representation of the directory structure."""
     if verbosity >= VERBOSITY_VERBOSE:
         logger.info(f"Generating file tree manually for {directory}")
@@ -242,16 +726,15 @@ def get_file_tree(directory: str, ignore_patterns: list, verbosity: int) -> str:
         level = root.replace(directory, '').count(os.sep)
         indent = '│   ' * level
         
-        # Skip ignored directories
-        if root != directory and is_ignored(root, directory, ignore_patterns):
-            dirs[:] = []  # Clear dirs to prevent further traversal
-            continue
-        
-        # Filter out ignored directories to prevent traversal
-        dirs[:] = [d for d in dirs if not is_ignored(os.path.join(root, d), directory, ignore_patterns)]
+        # Prune ignored directories before os.walk descends into them, so nothing
+        # below an ignored directory is ever listed or matched
+        dirs[:] = [
+            d for d in dirs
+            if d not in DEFAULT_IGNORED_DIRS and not is_ignored(os.path.join(root, d), directory, ignore_matcher, is_dir=True)
+        ]
         
         # Filter files that shouldn't be shown in the tree
-        visible_files = [f for f in files if not is_ignored(os.path.join(root, f), directory, ignore_patterns)]
+        visible_files = [f for f in files if not is_ignored(os.path.join(root, f), directory, ignore_matcher)]
         
         # Add subdirectories to the tree output
         for i, dir_name in enumerate(sorted(dirs)):
@@ -271,70 +754,50 @@ def get_file_tree(directory: str, ignore_patterns: list, verbosity: int) -> str:
     
     return '\n'.join(output)
 
-def get_git_files(directory: str, verbosity: int) -> list:
+@functools.lru_cache(maxsize=None)
+def _git_ls_files(directory: str) -> Optional[tuple]:
     """
-    Get a list of all files tracked by Git (respecting .gitignore rules).
-    Returns an empty list if Git is not available or the directory is not a Git repository.
+    Run git ls-files once per directory and cache the result for every caller.
+    
+    Returns:
+        Tuple of file paths relative to the directory, or None if Git is not
+        available or the directory is not a Git repository
     """
     try:
-        import subprocess
-        
-        # Save current directory to return to it later
-        original_dir = os.getcwd()
-        os.chdir(directory)
-        
-        # Check if this is a git repository
-        result = subprocess.run(
-            ["git", "rev-parse", "--is-inside-work-tree"],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode != 0:
-            if verbosity >= VERBOSITY_NORMAL:
-                logger.info("Not a git repository. Using manual file discovery.")
-            os.chdir(original_dir)
-            return []
-        
-        # Get all tracked files using git ls-files
-        if verbosity >= VERBOSITY_VERBOSE:
-            logger.info("Getting tracked files from git")
-        
+        # cwd= instead of os.chdir keeps the process working directory untouched
         result = subprocess.run(
             ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
+            cwd=directory,
             capture_output=True,
             text=True,
             check=True
         )
-        
-        # Convert relative paths to absolute paths and normalize them
-        git_files = []
-        for line in result.stdout.split('\n'):
-            if line.strip():
-                abs_path = os.path.join(directory, line)
-                # Normalize path separators for Windows
-                git_files.append(os.path.normpath(abs_path))
-        
-        # Return to original directory
-        os.chdir(original_dir)
-        
-        if verbosity >= VERBOSITY_VERBOSE:
-            logger.info(f"Found {len(git_files)} tracked files from git")
-            
-        return git_files
+    except (subprocess.CalledProcessError, OSError):
+        return None
     
-    except Exception as e:
+    return tuple(line for line in result.stdout.split('\n') if line.strip())
+
+def get_git_files(directory: str, verbosity: int) -> list:
+    """
+    Get a list of all files tracked by Git (respecting .gitignore rules).
+    Returns an empty list if Git is not available or the directory is not a Git repository.
+    """
+    if verbosity >= VERBOSITY_VERBOSE:
+        logger.info("Getting tracked files from git")
+    
+    git_files = _git_ls_files(directory)
+    if git_files is None:
         if verbosity >= VERBOSITY_NORMAL:
-            logger.info(f"Error getting git files: {str(e)}")
-        
-        # Return to original directory if changed
-        try:
-            os.chdir(original_dir)
-        except:
-            pass
-            
+            logger.info("Not a git repository. Using manual file discovery.")
         return []
+    
+    # Convert relative paths to absolute paths and normalize them for Windows
+    git_files = [os.path.normpath(os.path.join(directory, line)) for line in git_files]
+    
+    if verbosity >= VERBOSITY_VERBOSE:
+        logger.info(f"Found {len(git_files)} tracked files from git")
+        
+    return git_files
 
 def get_git_file_tree(directory: str, verbosity: int) -> str:
     """
@@ -344,60 +807,37 @@ def get_git_file_tree(directory: str, verbosity: int) -> str:
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Generating file tree for {directory} using Git")
     
+    git_files = _git_ls_files(directory)
+    if git_files is None:
+        if verbosity >= VERBOSITY_NORMAL:
+            logger.info("Not a git repository. Using manual tree generation.")
+        return get_file_tree(directory, None, verbosity)
+    
     try:
-        import subprocess
-        
-        # Save current directory to return to it later
-        original_dir = os.getcwd()
-        os.chdir(directory)
-        
-        # Check if this is a git repository
-        result = subprocess.run(
-            ["git", "rev-parse", "--is-inside-work-tree"],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode != 0:
-            if verbosity >= VERBOSITY_NORMAL:
-                logger.info("Not a git repository. Using manual tree generation.")
-            os.chdir(original_dir)
-            return get_file_tree(directory, [], verbosity)
-        
-        # Get all tracked files using git ls-files
-        result = subprocess.run(
-            ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        git_files = [line for line in result.stdout.split('\n') if line]
-        
-        # Return to original directory
-        os.chdir(original_dir)
-        
         # Build the tree structure
         base_dir = os.path.basename(os.path.normpath(directory))
         tree = {base_dir: {}}
         
+        # Sorted paths share directory prefixes with their predecessor, so keep
+        # the directories of the previous path and only descend into new ones
+        prev_dirs = []
+        nodes = [tree[base_dir]]
         for file_path in sorted(git_files):
-            # Normalize path separators for Windows
-            file_path = file_path.replace('/', os.sep)
+            # Git always separates components with '/'; interning makes the
+            # repeated directory names one shared string
+            *dirs, file_name = [sys.intern(part) for part in file_path.split('/')]
             
-            # Split into path components
-            parts = file_path.split(os.sep)
+            shared = 0
+            for prev_dir, dir_name in zip(prev_dirs, dirs):
+                if prev_dir is not dir_name:
+                    break
+                shared += 1
+            del nodes[shared + 1:]
             
-            # Build tree structure
-            current = tree[base_dir]
-            for i, part in enumerate(parts):
-                if i == len(parts) - 1:  # File (leaf node)
-                    current[part] = None
-                else:  # Directory
-                    if part not in current:
-                        current[part] = {}
-                    current = current[part]
+            for dir_name in dirs[shared:]:
+                nodes.append(nodes[-1].setdefault(dir_name, {}))
+            nodes[-1][file_name] = None  # File (leaf node)
+            prev_dirs = dirs
         
         # Convert tree structure to string representation
         output = []
@@ -430,10 +870,27 @@ def get_git_file_tree(directory: str, verbosity: int) -> str:
         logger.error(f"Error generating git file tree: {str(e)}")
         if verbosity >= VERBOSITY_NORMAL:
             logger.info("Falling back to manual tree generation")
-        return get_file_tree(directory, [], verbosity)
+        return get_file_tree(directory, None, verbosity)
+
+def read_files_parallel(paths: list) -> dict:
+    """
+    Read several files concurrently on IO_POOL so their open and read latencies overlap.
+    
+    Args:
+        paths: List of file paths
+        
+    Returns:
+        Dictionary mapping each file path to its content
+    """
+    return dict(zip(paths, IO_POOL.map(read_file_content, paths)))
 
 def read_file_content(file_path: str) -> str:
-    """Read and return the content of a file."""
+    """
+    Read and return the content of a file, up to one character past TRUNCATION_LIMIT.
+    
+    Reading stops there because only the first TRUNCATION_LIMIT characters are ever sent;
+    the extra character lets the prompt builder tell that the file was truncated.
+    """
     try:
         # Normalize path separators for Windows
         normalized_path = os.path.normpath(file_path)
@@ -441,11 +898,20 @@ def read_file_content(file_path: str) -> str:
             return f"ERROR: File not found - {file_path}"
             
         with open(normalized_path, 'r', encoding='utf-8', errors='replace') as f:
-            return f.read()
+            return f.read(TRUNCATION_LIMIT + 1)
     except Exception as e:
         logger.error(f"Error reading file {file_path}: {str(e)}")
         return f"ERROR: Unable to read file - {str(e)}"
 
+# Either a trailing comma before a closing bracket, or an unquoted property name after { or ,
+_FIX_JSON_RE = re.compile(r',\s*(?=[}\]])|(?<=[{,])(\s*)([a-zA-Z0-9_]+)(\s*:)')
+
+def _fix_json_match(match) -> str:
+    """Replacement callback for _FIX_JSON_RE: drop trailing commas, quote bare property names."""
+    if match.group(2) is None:
+        return ""
+    return f'{match.group(1)}"{match.group(2)}"{match.group(3)}'
+
 def fix_json_errors(json_str: str) -> str:
     """
     Attempt to fix common JSON syntax errors before parsing.
@@ -456,14 +922,9 @@ def fix_json_errors(json_str: str) -> str:
     Returns:
         Fixed JSON string
     """
-    # Fix trailing commas in objects (e.g., {"a": 1, "b": 2,})
-    import re
-    json_str = re.sub(r',\s*}', '}', json_str)
-    json_str = re.sub(r',\s*]', ']', json_str)
-    
-    # Fix missing quotes around property names
-    # Note: This is a simplistic approach and might not catch all cases
-    json_str = re.sub(r'([{,]\s*)([a-zA-Z0-9_]+)(\s*:)', r'\1"\2"\3', json_str)
+    # Fix trailing commas (e.g., {"a": 1, "b": 2,}) and missing quotes around property names
+    # in a single scan. Note: the key fix is a simplistic approach and might not catch all cases
+    json_str = _FIX_JSON_RE.sub(_fix_json_match, json_str)
     
     # Remove any single quotes used instead of double quotes for strings
     # This is risky and should only be done if we're fairly certain the JSON has this issue
@@ -471,188 +932,200 @@ def fix_json_errors(json_str: str) -> str:
     
     return json_str
 
-def batch_summarize_files(batch: list, api_key: str, model: str, verbosity: int, batch_token_limit: int) -> str:
+class TokenBucket:
+    """
+    Proactive requests-per-minute and tokens-per-minute limiter shared by concurrent API calls.
+
+    Capacity refills continuously and is corrected from the x-ratelimit-* response headers,
+    so requests wait before hitting the server's limits instead of failing with 429s.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Add the capacity accumulated since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.available_requests = min(
+            self.requests_per_minute,
+            self.available_requests + elapsed * self.requests_per_minute / 60
+        )
+        self.available_tokens = min(
+            self.tokens_per_minute,
+            self.available_tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """Wait until one request and the estimated number of tokens are available, then consume them."""
+        async with self._lock:
+            while True:
+                self._refill()
+                # A single request can never need more than the full per-minute budget. Clamp on
+                # every pass, since response headers may lower the limit while we wait
+                needed_tokens = min(estimated_tokens, self.tokens_per_minute)
+                if self.available_requests >= 1 and self.available_tokens >= needed_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= needed_tokens
+                    return
+
+                # Sleep just long enough for the scarcer resource to refill
+                wait_seconds = 60 * max(
+                    (1 - self.available_requests) / self.requests_per_minute,
+                    (needed_tokens - self.available_tokens) / self.tokens_per_minute
+                )
+                logger.debug(f"Rate limiter waiting {wait_seconds:.2f} seconds")
+                await asyncio.sleep(wait_seconds)
+
+    def update_from_headers(self, headers) -> None:
+        """Align the bucket with the limits and remaining budget reported by the API."""
+        def _header_int(name):
+            try:
+                return int(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self._refill()
+
+        limit_requests = _header_int("x-ratelimit-limit-requests")
+        limit_tokens = _header_int("x-ratelimit-limit-tokens")
+        if limit_requests:
+            self.requests_per_minute = limit_requests
+        if limit_tokens:
+            self.tokens_per_minute = limit_tokens
+
+        # Never assume more budget than the server says is left
+        remaining_requests = _header_int("x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            self.available_requests = min(self.available_requests, remaining_requests)
+        if remaining_tokens is not None:
+            self.available_tokens = min(self.available_tokens, remaining_tokens)
+
+def is_retryable_error(error: Exception) -> bool:
+    """Return True for rate limit (429), server (5xx) and connection errors worth retrying."""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+async def batch_summarize_files_async(batch: list, client: openai.AsyncOpenAI, model: str, verbosity: int,
+                                      batch_token_limit: int, bucket: TokenBucket,
+                                      max_completion_tokens: int = DEFAULT_MAX_COMPLETION_TOKENS) -> tuple:
     """
     Send a batch of files to OpenAI API for detailed analysis.
-    
+
     Args:
-        batch: List of tuples (file_path, file_content)
-        api_key: OpenAI API key
+        batch: List of tuples (file_path, file_content, rel_path), with rel_path relative to the analyzed directory
+        client: Shared asynchronous OpenAI client
         model: Model to use
         verbosity: Verbosity level
         batch_token_limit: Maximum tokens for the response for this batch
-        
+        bucket: Rate limiter shared by all concurrent batches
+        max_completion_tokens: Model's completion limit; a response cut off at batch_token_limit
+            is retried with a doubled budget up to this limit
+
     Returns:
-        JSON string with detailed analysis of all files
+        Tuple of (JSON string with detailed analysis of all files, completion tokens used or None)
     """
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Analyzing batch of {len(batch)} files with token limit {batch_token_limit}")
     
-    # Create batch content
-    batch_content = ""
+    # Create batch content, collecting the pieces and joining them once
+    content_parts = []
     file_paths = []
     
-    for i, (file_path, content) in enumerate(batch, 1):
-        rel_path = os.path.relpath(file_path, os.path.dirname(os.path.dirname(file_path)))
+    for i, (file_path, content, rel_path) in enumerate(batch, 1):
         file_paths.append(rel_path)
-        batch_content += f"\n--- FILE {i}: {rel_path} ---\n\n"
+        content_parts.append(f"\n--- FILE {i}: {rel_path} ---\n\n")
         # Truncate very large files to avoid rate limits
         if len(content) > TRUNCATION_LIMIT:
-            truncated_content = content[:TRUNCATION_LIMIT] + "\n\n... [content truncated for length] ...\n"
-            batch_content += truncated_content
+            content_parts.append(content[:TRUNCATION_LIMIT])
+            content_parts.append("\n\n... [content truncated for length] ...\n")
         else:
-            batch_content += content
-        batch_content += "\n\n"
+            content_parts.append(content)
+        content_parts.append("\n\n")
     
-    # Setup OpenAI client
-    client = openai.OpenAI(api_key=api_key)
-    
-    # Prepare the prompt for detailed analysis
-    prompt = f"""
-I need you to analyze a batch of source code files and provide a detailed analysis in JSON format. Your ENTIRE response MUST stay UNDER {batch_token_limit} tokens - this is a HARD REQUIREMENT.
-
-FOLLOW THIS EXACT RESPONSE STRUCTURE - DO NOT DEVIATE:
-{{
-  "files": {{
-    "file_path_1": {{
-      "file_type": "...",
-      "file_purpose": "...",
-      "dependencies": ["dep1", "dep2"],
-      "classes": [
-        {{
-          "name": "ClassName",
-          "purpose": "Brief description",
-          "methods": ["method1", "method2"]
-        }}
-      ],
-      "functions": [
-        {{
-          "name": "funcName",
-          "purpose": "Brief description"
-        }}
-      ],
-      "api_endpoints": [
-        {{
-          "path": "/path",
-          "method": "GET/POST/etc"
-        }}
-      ],
-      "design_patterns": ["Pattern description"],
-      "integration_points": ["Integration description"],
-      "relationships": ["Relationship description"]
-    }},
-    "file_path_2": {{
-      ...similar structure...
-    }}
-  }}
-}}
-
-STRICT TOKEN LIMIT ENFORCEMENT:
-- Your ENTIRE response MUST be under {batch_token_limit} tokens
-- If you cannot fit complete analysis for all files within token limits:
-  1. Reduce detail while maintaining coverage of all files
-  2. Prioritize the most important information for each file
-  3. Use concise descriptions instead of full explanations
-  4. Omit less critical information when necessary
-- Token limits take precedence over completeness of analysis
-- Prioritize breadth (covering all files) over depth
-
-CRITICAL JSON RULES:
-1. Use DOUBLE QUOTES for all keys and string values
-2. NO SEMICOLONS in JSON - ever!
-3. NO TRAILING COMMAS after the last item in objects or arrays
-4. Every opening {{ or [ must have a matching closing }} or ]
-5. Every property name must be quoted: "name": value
-6. Arrays use square brackets with comma-separated values
-7. DO NOT include any field with empty values - omit them entirely
-8. Commas separate items in arrays and objects, but NOT after the last item
-9. NEVER use "files" as an array - it must be an object with file paths as keys
-
-For each file, extract the following information (prioritizing the most important aspects):
-
-* **File Type:** Categorize the file (e.g., "model", "service", "api_endpoint", "utility", etc.)
-* **File Purpose:** A brief description of the file's main purpose and functionality
-* **Dependencies:** List key imports and dependencies used by this file
-* **Classes:** List any classes defined in the file, with details for each:
-  * **Name:** Class name
-  * **Purpose:** A brief description of the class
-  * **Methods:** Key methods with their purpose
-  * **Inheritance:** Parent classes or interfaces (if significant)
-* **Functions:** List top-level functions with:
-  * **Name:** Function name
-  * **Purpose:** A short description of what the function does
-* **API Endpoints:** If the file defines API endpoints:
-  * **Path:** The route path 
-  * **Method:** HTTP method (GET, POST, etc.)
-* **Design Patterns:** Identify any notable design patterns used
-* **Integration Points:** Note where this file interfaces with other components
-* **Relationships:** How this file relates to other parts of the system
-
-CONSISTENCY GUIDELINES:
-1. Use similar detail levels across similar file types
-2. Include the same property types for files of similar purposes
-3. Apply consistent naming conventions in your descriptions
-4. Use consistent terminology throughout the analysis
-
-ANALYSIS PRIORITIES (focus on these when token limits are tight):
-1. File purpose and type
-2. Key dependencies 
-3. Important classes and methods
-4. Key functions
-5. Integration points and relationships
-
-REQUIRED FILES TO ANALYZE:
-{batch_content}
-
-FINAL VALIDATION STEPS (perform these before submitting):
-1. Check all brackets and braces are properly matched
-2. Verify no trailing commas exist in your JSON
-3. Confirm all property names and string values use double quotes
-4. Ensure the response is nested exactly as shown in the template
-5. Verify "files" is an object, not an array
-6. Confirm your response is under the token limit by removing unnecessary detail if needed
-
-Remember: Return ONLY valid JSON - no explanation text, no markdown formatting, no code blocks.
-"""
+    batch_content = "".join(content_parts)
     
     max_retries = 3
     retry_delay = 5  # seconds
     
-    for retry in range(max_retries):
-        try:
-            # Call the API
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert code analyzer that always returns pure JSON with no markdown formatting or explanations. You strictly adhere to token limits and JSON syntax rules."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            # Extract and return the JSON content
-            return response.choices[0].message.content.strip()
-        
-        except Exception as e:
-            error_message = str(e)
-            logger.error(f"Error analyzing batch (attempt {retry+1}/{max_retries}): {error_message}")
+    # Ask again with a larger budget whenever a response is cut off at the token limit
+    while True:
+        # Only the batch-specific parts go in the user message
+        prompt = f"TOKEN_LIMIT={batch_token_limit}\n\nFILES:\n{batch_content}"
+        
+        # Rate limits count both the prompt and the requested completion budget
+        estimated_tokens = (len(_ANALYSIS_SYSTEM_PROMPT) + len(prompt)) // CHARS_PER_TOKEN + batch_token_limit
+        
+        for retry in range(max_retries):
+            try:
+                # Wait for rate limit headroom before calling the API
+                await bucket.acquire(estimated_tokens)
+                
+                # Call the API, keeping the raw response for its rate limit headers
+                raw_response = await client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": _ANALYSIS_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=batch_token_limit  # Cap generation server-side, not just in the prompt
+                )
+                bucket.update_from_headers(raw_response.headers)
+                response = raw_response.parse()
+                
+                if response.choices[0].finish_reason == "length":
+                    # A truncated response is broken JSON, so retry with room for the rest
+                    if batch_token_limit < max_completion_tokens:
+                        new_token_limit = min(batch_token_limit * 2, max_completion_tokens)
+                        logger.warning(f"Batch response was cut off at the {batch_token_limit} token limit; "
+                                       f"retrying with {new_token_limit}")
+                        batch_token_limit = new_token_limit
+                        break
+                    logger.warning(f"Batch response was cut off at the {batch_token_limit} token limit")
+                
+                # Extract and return the JSON content along with the tokens it cost
+                completion_tokens = response.usage.completion_tokens if response.usage else None
+                return response.choices[0].message.content.strip(), completion_tokens
             
-            # If we've reached max retries, give up and return an error JSON
-            if retry == max_retries - 1:
-                error_json = {
-                    "files": {
-                        file_path: {
-                            "error": f"Analysis failed after {max_retries} attempts: {error_message}",
-                            "file_path": file_path
-                        } for file_path in file_paths
+            except Exception as e:
+                error_message = str(e)
+                logger.error(f"Error analyzing batch (attempt {retry+1}/{max_retries}): {error_message}")
+                
+                # Give up on non-transient errors or once we've reached max retries, and return an error JSON
+                if not is_retryable_error(e) or retry == max_retries - 1:
+                    error_json = {
+                        "files": {
+                            file_path: {
+                                "error": f"Analysis failed after {retry+1} attempts: {error_message}",
+                                "file_path": file_path
+                            } for file_path in file_paths
+                        }
                     }
-                }
-                return json.dumps(error_json)
-            
-            # Otherwise, wait before retrying
-            logger.info(f"Waiting {retry_delay} seconds before retrying...")
-            time.sleep(retry_delay)
-            # Increase delay for next retry (exponential backoff)
-            retry_delay *= 2
+                    return json_dumps(error_json), None
+                
+                # Otherwise, wait before retrying
+                logger.info(f"Waiting {retry_delay} seconds before retrying...")
+                await asyncio.sleep(retry_delay)
+                # Increase delay for next retry (exponential backoff)
+                retry_delay *= 2
+
+@functools.lru_cache(maxsize=None)
+def get_client(api_key: str) -> openai.OpenAI:
+    """
+    Return the synchronous OpenAI client for an API key, creating it on first use.
+    
+    Reusing one client keeps its HTTP connection pool alive between calls
+    instead of paying for a fresh TCP and TLS handshake each time.
+    """
+    return openai.OpenAI(api_key=api_key)
 
 def optimize_json_output(api_key: str, model: str, input_file: str, output_file: str, 
                         optimization_model: str = None, verbosity: int = VERBOSITY_NORMAL) -> bool:
@@ -677,13 +1150,16 @@ def optimize_json_output(api_key: str, model: str, input_file: str, output_file:
         logger.info(f"Optimizing JSON from {input_file} to {output_file} using model {actual_model}")
     
     try:
-        # Read the original JSON file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            original_data = json.load(f)
+        # Keep the original bytes as-is for the size comparison and the fallback copy
+        with open(input_file, 'rb') as f:
+            original_bytes = f.read()
         
         # Store original size for comparison
-        original_json_str = json.dumps(original_data)
-        original_size = len(original_json_str)
+        original_size = len(original_bytes)
+        
+        # Send the JSON compact rather than the indented file, which costs far more prompt tokens
+        original_data = json_loads(original_bytes)
+        original_json_str = json_dumps(original_data)
         
         if verbosity >= VERBOSITY_VERBOSE:
             logger.info(f"Original JSON size: {original_size:,} bytes")
@@ -691,36 +1167,8 @@ def optimize_json_output(api_key: str, model: str, input_file: str, output_file:
             if "file_analyses" in original_data:
                 logger.info(f"file_analyses contains {len(original_data['file_analyses'])} entries")
         
-        # Prepare specific structure for optimization
-        prompt = f"""
-I need you to optimize and compress the following JSON without losing any essential information.
-You must keep the exact same structure with "metadata", "file_tree", and "file_analyses" keys.
-
-OPTIMIZATION GUIDELINES:
-1. Preserve the exact same structure with "metadata", "file_tree", and "file_analyses" keys
-2. Remove any redundant or duplicated information
-3. Shorten descriptions while preserving key insights
-4. Make the descriptions more concise but maintain the same meaning
-5. Do not remove any file paths or entries from "file_analyses"
-6. Keep all metadata intact
-
-CRITICAL JSON RULES:
-1. Use DOUBLE QUOTES for all keys and string values (never single quotes)
-2. NO trailing commas after the last item in objects or arrays
-3. Every property name must be quoted: "name": value
-4. DO NOT remove any of the top-level keys (metadata, file_tree, file_analyses)
-5. The result MUST have the same structure as the input
-6. Carefully check for balanced brackets and braces
-7. Ensure there are no syntax errors in the resulting JSON
-
-Here is the JSON to optimize:
-{original_json_str}
-
-Return ONLY the optimized JSON with no additional text or explanation. Ensure it's valid JSON that will parse correctly.
-"""
-        
         # Call the API
-        client = openai.OpenAI(api_key=api_key)
+        client = get_client(api_key)
         
         if verbosity >= VERBOSITY_VERBOSE:
             logger.info("Calling AI for JSON optimization")
@@ -728,8 +1176,8 @@ Return ONLY the optimized JSON with no additional text or explanation. Ensure it
         response = client.chat.completions.create(
             model=actual_model,
             messages=[
-                {"role": "system", "content": "You are an expert at optimizing and compressing JSON data while preserving essential information and structure. Your output must be valid JSON with no syntax errors."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": _OPTIMIZATION_SYSTEM_PROMPT},
+                {"role": "user", "content": original_json_str}
             ],
             temperature=0.0  # Reduce randomness for more predictable output
         )
@@ -741,9 +1189,10 @@ Return ONLY the optimized JSON with no additional text or explanation. Ensure it
         try:
             fixed_json_str = fix_json_errors(optimized_json_str)
             
-            # Parse to validate and format
-            optimized_data = json.loads(fixed_json_str)
-            optimized_size = len(fixed_json_str)
+            # Parse to validate, then format exactly as it will be written so sizes compare like for like
+            optimized_data = json_loads(fixed_json_str)
+            optimized_bytes = _json_bytes(optimized_data, pretty=True)
+            optimized_size = len(optimized_bytes)
             
             if verbosity >= VERBOSITY_VERBOSE:
                 logger.info(f"Optimized JSON size: {optimized_size:,} bytes")
@@ -759,13 +1208,13 @@ Return ONLY the optimized JSON with no additional text or explanation. Ensure it
                 
                 if verbosity >= VERBOSITY_NORMAL:
                     logger.info("Optimization did not reduce file size or preserve structure. Using original file.")
-                with open(output_file, 'w', encoding='utf-8') as out_f:
-                    json.dump(original_data, out_f, indent=2)
+                with open(output_file, 'wb') as out_f:
+                    out_f.write(original_bytes)
                 return False
             
             # Write the optimized JSON to the output file
-            with open(output_file, 'w', encoding='utf-8') as out_f:
-                json.dump(optimized_data, out_f, indent=2)
+            with open(output_file, 'wb') as out_f:
+                out_f.write(optimized_bytes)
                 
             if verbosity >= VERBOSITY_NORMAL:
                 reduction = (original_size - optimized_size) / original_size * 100
@@ -784,8 +1233,8 @@ Return ONLY the optimized JSON with no additional text or explanation. Ensure it
                 logger.info(f"Saved problematic JSON to {error_file} for debugging")
             
             logger.error("Falling back to original JSON")
-            with open(output_file, 'w', encoding='utf-8') as out_f:
-                json.dump(original_data, out_f, indent=2)
+            with open(output_file, 'wb') as out_f:
+                out_f.write(original_bytes)
             return False
             
     except Exception as e:
@@ -803,7 +1252,12 @@ def process_directory(
     batch_size: int = DEFAULT_BATCH_SIZE,
     use_git: bool = True,
     max_token_limit: int = DEFAULT_MAX_TOKEN_LIMIT,
-    pause_seconds: int = DEFAULT_PAUSE_SECONDS
+    pause_seconds: int = DEFAULT_PAUSE_SECONDS,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+    context_window: int = DEFAULT_CONTEXT_WINDOW,
+    max_completion_tokens: int = DEFAULT_MAX_COMPLETION_TOKENS
 ) -> str:
     """
     Process a directory, analyze its files, and write the results.
@@ -815,7 +1269,7 @@ def process_directory(
     set_verbosity(verbosity)
     
     # Get current timestamp for output file
-    timestamp = datetime.now(timezone(timedelta(hours=-5))).strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = datetime.now(_EST).strftime('%Y-%m-%d %H:%M:%S')
     
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Starting codebase analysis with verbosity level {verbosity}")
@@ -839,9 +1293,14 @@ def process_directory(
             logger.error(f"Custom .gitignore not found: {custom_gitignore}")
             sys.exit(1)
     
+    # Compile the patterns once for every ignore check below
+    ignore_matcher = compile_ignore_matcher(ignore_patterns)
+    
     # Try to use Git if requested
     file_tree = ""
     all_files = []
+    file_entries = {}  # DirEntry of each file found by manual scanning
+    ignored_files = []  # Ignored files and directories pruned by manual scanning
     
     if use_git:
         # Try to get file tree from Git
@@ -857,49 +1316,36 @@ def process_directory(
             # Fall back to manual scanning
             if verbosity >= VERBOSITY_NORMAL:
                 logger.info("Falling back to manual file scanning")
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    all_files.append(file_path)
+            scanned = _scandir_files(directory, directory, ignore_matcher, ignored_files)
+            file_entries = {entry.path: entry for entry in scanned}
+            all_files = list(file_entries)
             
-            file_tree = get_file_tree(directory, ignore_patterns, verbosity)
+            file_tree = get_file_tree(directory, ignore_matcher, verbosity)
     else:
         # Use manual file discovery
         if verbosity >= VERBOSITY_NORMAL:
             logger.info("Using manual file scanning (Git disabled)")
-        for root, _, files in os.walk(directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                all_files.append(file_path)
+        scanned = _scandir_files(directory, directory, ignore_matcher, ignored_files)
+        file_entries = {entry.path: entry for entry in scanned}
+        all_files = list(file_entries)
         
-        file_tree = get_file_tree(directory, ignore_patterns, verbosity)
+        file_tree = get_file_tree(directory, ignore_matcher, verbosity)
     
     if verbosity >= VERBOSITY_VERBOSE:
         logger.info(f"Found {len(all_files)} total files")
     
-    # Filter files based on ignore patterns and file type (if not using Git)
+    # Filter files by type; ignore patterns were already applied by Git or during the scan
     included_files = []
-    ignored_files = []
     binary_files = []
     
     if verbosity >= VERBOSITY_NORMAL:
         logger.info("Filtering files...")
     
     for file_path in all_files:
-        # If we got files from Git, they're already filtered, just check file type
-        if use_git and all_files and len(all_files) > 0 and all_files[0].startswith(directory):
-            if is_text_file(file_path):
-                included_files.append(file_path)
-            else:
-                binary_files.append(file_path)
+        if is_text_file(file_path, file_entries.get(file_path)):
+            included_files.append(file_path)
         else:
-            # Normal path - check both gitignore and if it's a text file
-            if is_ignored(file_path, directory, ignore_patterns):
-                ignored_files.append(file_path)
-            elif is_text_file(file_path):
-                included_files.append(file_path)
-            else:
-                binary_files.append(file_path)
+            binary_files.append(file_path)
     
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Files summary: {len(included_files)} included, {len(ignored_files)} ignored, {len(binary_files)} binary")
@@ -921,14 +1367,20 @@ def process_directory(
             logger.info("Operation cancelled by user")
             sys.exit(0)
     
+    # Look up every file size once; all later size calculations reuse this index
+    size_index = build_size_index(included_files, file_entries)
+    
     # Calculate total codebase size for token allocation
-    total_codebase_size = calculate_total_codebase_size(included_files)
+    total_codebase_size = calculate_total_codebase_size(included_files, size_index)
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Total codebase size: {total_codebase_size:,} bytes")
     
     # Calculate total_files before using it
     total_files = len(included_files)
     
+    # Compute each file's path relative to the analyzed directory once; it keys the analyses
+    rel_paths = {file_path: os.path.relpath(file_path, directory) for file_path in included_files}
+    
     # Create the initial output structure
     output_data = {
         "metadata": {
@@ -944,120 +1396,166 @@ def process_directory(
     }
     
     # Write the initial JSON output with empty analyses
-    with open(output_file, 'w', encoding='utf-8') as out_f:
-        json.dump(output_data, out_f, indent=2)
+    write_json_file(output_file, output_data)
+    
+    # Pack files into as few requests as the model's limits allow
+    batches = pack_batches(included_files, batch_size, size_index, total_codebase_size, max_token_limit,
+                           context_window, max_completion_tokens)
+    total_batches = len(batches)
     
     if verbosity >= VERBOSITY_NORMAL:
         logger.info(f"Created initial output file: {output_file}")
-        logger.info(f"Beginning analysis of {total_files} files in batches of {batch_size}...")
+        logger.info(f"Beginning analysis of {total_files} files in {total_batches} batches of up to {batch_size} (up to {max_concurrency} concurrent)...")
+    
+    completed_batches = 0
+    tokens_per_byte_ema = INITIAL_TOKENS_PER_BYTE
     
-    # Process files in batches
-    for i in range(0, len(included_files), batch_size):
-        batch = included_files[i:i + batch_size]
+    # Completed batches are kept in memory, keyed by batch number, and merged into the
+    # output once at the end, so no batch rewrites everything before it. Each one is also
+    # appended to a JSON Lines sidecar so an interrupted run keeps its finished batches.
+    batch_analyses = {}
+    partial_file = f"{output_file}.partial.jsonl"
+    partial_f = open(partial_file, 'wb')
+    
+    async def _process_batch(batch_number, batch_with_content, client, bucket):
+        """Analyze one batch whose file contents were prefetched and append its analyses to the sidecar."""
+        nonlocal completed_batches, tokens_per_byte_ema
+        
+        batch = [file_path for file_path, _, _ in batch_with_content]
         
         if verbosity >= VERBOSITY_NORMAL:
-            logger.info(f"Processing batch {i//batch_size + 1}/{(total_files + batch_size - 1)//batch_size} ({len(batch)} files)")
+            logger.info(f"Processing batch {batch_number}/{total_batches} ({len(batch)} files)")
         
         # Calculate batch size in bytes
-        batch_size_bytes = calculate_batch_size_bytes(batch)
+        batch_size_bytes = calculate_batch_size_bytes(batch, size_index)
         
-        # Calculate token limit for this batch based on proportion of codebase
-        batch_token_limit = calculate_batch_token_limit(batch_size_bytes, total_codebase_size, max_token_limit)
+        # Calculate token limit for this batch from observed usage, within its budget share and the model's output limit
+        batch_token_limit = min(
+            calculate_batch_token_limit(batch_size_bytes, total_codebase_size, max_token_limit, tokens_per_byte_ema,
+                                        len(batch)),
+            max_completion_tokens
+        )
         
         if verbosity >= VERBOSITY_VERBOSE:
             logger.info(f"Batch size: {batch_size_bytes:,} bytes ({batch_size_bytes/total_codebase_size:.2%} of codebase)")
             logger.info(f"Allocated token limit for batch: {batch_token_limit}")
         
-        # Load content for each file in the batch
-        batch_with_content = []
-        for file_path in batch:
-            content = read_file_content(file_path)
-            batch_with_content.append((file_path, content))
-        
         # Analyze the batch
-        batch_analysis = batch_summarize_files(batch_with_content, api_key, model, verbosity, batch_token_limit)
+        batch_analysis, completion_tokens = await batch_summarize_files_async(
+            batch_with_content, client, model, verbosity, batch_token_limit, bucket, max_completion_tokens
+        )
+        completed_batches += 1
         
-        # Read the current state of the file
-        try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                output_data = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            logger.error(f"Error reading existing output file: {str(e)}")
-            # Initialize with empty data if file is corrupted or missing
-            output_data = {
-                "metadata": {
-                    "generated_at": timestamp,
-                    "total_files": total_files,
-                    "directory": directory,
-                    "completion_status": "in_progress",
-                    "total_codebase_size_bytes": total_codebase_size,
-                    "max_token_limit": max_token_limit
-                },
-                "file_tree": file_tree,
-                "file_analyses": {}
-            }
+        # Learn how many tokens batches actually need so later limits track reality
+        tokens_per_byte_ema = update_tokens_per_byte(tokens_per_byte_ema, completion_tokens, batch_size_bytes)
+        if verbosity >= VERBOSITY_VERBOSE:
+            logger.info(f"Batch used {completion_tokens} completion tokens; estimate now {tokens_per_byte_ema:.3f} tokens/byte")
         
-        # Update the analyses with new batch data
+        # Collect the analyses of this batch
+        analyses = {}
         try:
             # Parse the JSON response
-            batch_data = json.loads(batch_analysis)
-            
-            # Check for the expected structure
-            if "files" in batch_data:
+            batch_data = json_loads(batch_analysis)
+        
+            # Check for the expected structure; anything else (e.g. "files" as an array)
+            # only fails this batch instead of aborting every batch still in flight
+            if isinstance(batch_data, dict) and isinstance(batch_data.get("files"), dict):
                 # Process each file analysis to remove empty values
                 for file_path, analysis in batch_data["files"].items():
-                    # Recursively remove empty lists, dictionaries, None values, or empty strings
+                    # Remove empty lists, dictionaries, None values and empty strings at any depth
                     cleaned_analysis = clean_empty_values(analysis)
                     if cleaned_analysis:  # Only add if there's content
-                        output_data["file_analyses"][file_path] = cleaned_analysis
+                        analyses[file_path] = cleaned_analysis
             else:
-                logger.error("Unexpected JSON structure: 'files' key not found")
+                logger.error("Unexpected JSON structure: 'files' object not found")
                 # Try to salvage what we can from the response
                 for file_path in batch:
-                    rel_path = os.path.relpath(file_path, directory)
-                    output_data["file_analyses"][rel_path] = {
+                    analyses[rel_paths[file_path]] = {
                         "error": "Failed to parse analysis",
                         "raw_response": batch_analysis
                     }
-            
-            # Update progress information
-            output_data["metadata"]["completed_batches"] = i//batch_size + 1
-            output_data["metadata"]["total_batches"] = (total_files + batch_size - 1)//batch_size
-            output_data["metadata"]["files_analyzed"] = len(output_data["file_analyses"])
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {str(e)}")
             # If we can't parse JSON, just save the raw response
             for file_path in batch:
-                rel_path = os.path.relpath(file_path, directory)
-                output_data["file_analyses"][rel_path] = {
+                analyses[rel_paths[file_path]] = {
                     "error": "Failed to parse analysis",
                     "raw_response": batch_analysis
                 }
         
-        # Write the updated data back to the file
-        with open(output_file, 'w', encoding='utf-8') as out_f:
-            json.dump(output_data, out_f, indent=2)
+        # Append only this batch to the sidecar instead of rewriting the whole output file
+        batch_analyses[batch_number] = analyses
+        partial_f.write(_json_bytes({"batch": batch_number, "files": analyses}) + b"\n")
+        partial_f.flush()
         
         if verbosity >= VERBOSITY_NORMAL:
-            logger.info(f"Completed batch {i//batch_size + 1}/{(total_files + batch_size - 1)//batch_size}")
-            logger.info(f"Updated output file with {len(output_data['file_analyses'])} file analyses")
+            logger.info(f"Completed batch {batch_number}/{total_batches} ({completed_batches} done)")
+            logger.info(f"Saved {len(analyses)} file analyses to {partial_file}")
         
-        # Add a pause between batches to avoid rate limits
-        if i + batch_size < len(included_files):
+        # Add a pause before this worker picks up another batch to avoid rate limits
+        if pause_seconds and completed_batches < total_batches:
             if verbosity >= VERBOSITY_NORMAL:
                 logger.info(f"Pausing for {pause_seconds} seconds before next batch...")
-            time.sleep(pause_seconds)
+            await asyncio.sleep(pause_seconds)
+    
+    async def _process_all_batches():
+        """Analyze batches concurrently while a reader thread prefetches the contents of upcoming ones."""
+        bucket = TokenBucket(requests_per_minute, tokens_per_minute)
+        loop = asyncio.get_running_loop()
+        
+        # Bounded so large repos never hold more than a few batches of file contents in memory
+        prefetched = queue.Queue(maxsize=PREFETCH_BATCHES)
+        
+        def _read_batches():
+            """Producer: read each batch's files in parallel, overlapping disk I/O with API calls."""
+            try:
+                for batch_number, batch in enumerate(batches, 1):
+                    contents = read_files_parallel(batch)
+                    prefetched.put((batch_number, [
+                        (file_path, contents[file_path], rel_paths[file_path]) for file_path in batch
+                    ]))
+            except Exception as e:
+                logger.error(f"Error reading batch files: {str(e)}")
+            finally:
+                # One stop marker per worker
+                for _ in range(max_concurrency):
+                    prefetched.put(None)
+        
+        async def _worker(client):
+            """Consumer: analyze prefetched batches until the reader runs out."""
+            while True:
+                item = await loop.run_in_executor(None, prefetched.get)
+                if item is None:
+                    return
+                batch_number, batch_with_content = item
+                await _process_batch(batch_number, batch_with_content, client, bucket)
+        
+        reader = threading.Thread(target=_read_batches, daemon=True)
+        reader.start()
+        
+        # Our own backoff handles retries so every attempt goes through the rate limiter
+        async with openai.AsyncOpenAI(api_key=api_key, max_retries=0) as client:
+            await asyncio.gather(*(_worker(client) for _ in range(max_concurrency)))
+    
+    # Process files in concurrent batches
+    try:
+        asyncio.run(_process_all_batches())
+    finally:
+        partial_f.close()
     
-    # Update the final status
+    # Merge the batches into the output in batch order and write the final file once
     try:
-        with open(output_file, 'r', encoding='utf-8') as f:
-            output_data = json.load(f)
+        for batch_number in sorted(batch_analyses):
+            output_data["file_analyses"].update(batch_analyses[batch_number])
         
+        output_data["metadata"]["completed_batches"] = completed_batches
+        output_data["metadata"]["total_batches"] = total_batches
+        output_data["metadata"]["files_analyzed"] = len(output_data["file_analyses"])
         output_data["metadata"]["completion_status"] = "completed"
-        output_data["metadata"]["completion_time"] = datetime.now(timezone(timedelta(hours=-5))).strftime('%Y-%m-%d %H:%M:%S')
+        output_data["metadata"]["completion_time"] = datetime.now(_EST).strftime('%Y-%m-%d %H:%M:%S')
         
-        with open(output_file, 'w', encoding='utf-8') as out_f:
-            json.dump(output_data, out_f, indent=2)
+        write_json_file(output_file, output_data)
+        os.remove(partial_file)
     except Exception as e:
         logger.error(f"Error updating final status: {str(e)}")
     
@@ -1096,6 +1594,16 @@ def main():
                        help=f"Maximum token limit for entire output JSON (default: {DEFAULT_MAX_TOKEN_LIMIT})")
     parser.add_argument("--pause-seconds", "-ps", type=int, default=DEFAULT_PAUSE_SECONDS,
                        help=f"Seconds to pause between batches (default: {DEFAULT_PAUSE_SECONDS})")
+    parser.add_argument("--max-concurrency", "-mc", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                       help=f"Maximum number of batches analyzed concurrently (default: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument("--requests-per-minute", "-rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                       help=f"Initial requests-per-minute budget, refined from API headers (default: {DEFAULT_REQUESTS_PER_MINUTE})")
+    parser.add_argument("--tokens-per-minute", "-tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE,
+                       help=f"Initial tokens-per-minute budget, refined from API headers (default: {DEFAULT_TOKENS_PER_MINUTE})")
+    parser.add_argument("--context-window", "-cw", type=int, default=DEFAULT_CONTEXT_WINDOW,
+                       help=f"Model context window in tokens; larger batches are split to fit (default: {DEFAULT_CONTEXT_WINDOW})")
+    parser.add_argument("--max-completion-tokens", "-mct", type=int, default=DEFAULT_MAX_COMPLETION_TOKENS,
+                       help=f"Maximum completion tokens the model can return (default: {DEFAULT_MAX_COMPLETION_TOKENS})")
     parser.add_argument("--optimize", "-op", action="store_true",
                        help="Optimize the output JSON for size and clarity")
     parser.add_argument("--optimized-output", "-oo", 
@@ -1125,7 +1633,12 @@ def main():
         batch_size=args.batch_size,
         use_git=args.use_git,
         max_token_limit=args.max_token_limit,
-        pause_seconds=args.pause_seconds
+        pause_seconds=args.pause_seconds,
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        context_window=args.context_window,
+        max_completion_tokens=args.max_completion_tokens
     )
     
     # Optimize JSON if requested